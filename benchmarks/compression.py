@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+#   Panel Profiles
+#
+#   This program is free software: you can redistribute it and/or modify it
+#   under the terms of the GNU General Public License version 3 or newer,
+#   as published by the Free Software Foundation.
+#
+#   This program is distributed in the hope that it will be useful, but
+#   WITHOUT ANY WARRANTY; without even the implied warranties of
+#   MERCHANTABILITY, SATISFACTORY QUALITY, or FITNESS FOR A PARTICULAR
+#   PURPOSE.  See the GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License along
+#   with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+'''Compare save time, load time and size of the profile compressions.
+
+Every bundled layout in data/layouts is packed once, loaded, and then saved
+and loaded again with each available compression at its default, fastest and
+smallest level. Nothing touches the running panel.
+
+usage: benchmarks/compression.py [-n REPEAT]
+'''
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+source_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(source_dir, 'xfce4-panel-profiles'))
+
+from panelconfig import PanelConfig, add_to_tar, open_archive  # noqa: E402
+from panelconfig import get_compressions, get_levels, get_suffix  # noqa: E402
+
+
+def pack_layout(layout_dir, filename):
+    with open_archive(filename, 'w') as t:
+        for root, dirs, files in os.walk(layout_dir):
+            for name in sorted(files):
+                path = os.path.join(root, name)
+                with open(path, 'rb') as f:
+                    add_to_tar(t, f.read(), os.path.relpath(path, layout_dir))
+
+
+def best_of(repeat, func):
+    best = None
+    for n in range(repeat):
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark profile compressions.')
+    parser.add_argument('-n', '--repeat', type=int, default=5,
+                        help='runs per measurement, the fastest one is reported')
+    args = parser.parse_args()
+
+    layouts_dir = os.path.join(source_dir, 'data', 'layouts')
+    layouts = sorted(d for d in os.listdir(layouts_dir)
+                     if os.path.isdir(os.path.join(layouts_dir, d)))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        configs = []
+        for layout in layouts:
+            filename = os.path.join(tmp, layout + '.tar')
+            pack_layout(os.path.join(layouts_dir, layout), filename)
+            configs.append(PanelConfig.from_file(filename))
+
+        print(f"{len(configs)} layouts, best of {args.repeat} runs")
+        print(f"{'compression':<12} {'level':>7} {'save ms':>9} {'load ms':>9} {'bytes':>9}")
+        for compression in get_compressions():
+            levels = get_levels(compression)
+            choices = [('default', None)]
+            if len(levels) > 0:
+                choices += [('fastest', levels[0]), ('smallest', levels[-1])]
+            for (label, level) in choices:
+                filenames = [os.path.join(tmp, f'{n}{get_suffix(compression)}')
+                             for n in range(len(configs))]
+
+                def save():
+                    for (pc, filename) in zip(configs, filenames):
+                        pc.to_file(filename, compression, level)
+
+                def load():
+                    for filename in filenames:
+                        PanelConfig.from_file(filename)
+
+                save_time = best_of(args.repeat, save)
+                load_time = best_of(args.repeat, load)
+                size = sum(os.path.getsize(filename) for filename in filenames)
+                print(f"{compression or 'none':<12} {label:>7} "
+                      f"{save_time * 1000:9.2f} {load_time * 1000:9.2f} {size:9d}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+#   Panel Profiles
+#
+#   This program is free software: you can redistribute it and/or modify it
+#   under the terms of the GNU General Public License version 3 or newer,
+#   as published by the Free Software Foundation.
+#
+#   This program is distributed in the hope that it will be useful, but
+#   WITHOUT ANY WARRANTY; without even the implied warranties of
+#   MERCHANTABILITY, SATISFACTORY QUALITY, or FITNESS FOR A PARTICULAR
+#   PURPOSE.  See the GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License along
+#   with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+'''Measure the config.txt parser.
+
+Every bundled data/layouts/*/config.txt is parsed with
+PanelConfig.parse_config, and the best time of a number of runs is
+printed, in total and per value. Parse errors are reported and make the
+script fail.
+
+usage: benchmarks/parser.py [-n REPEAT]
+'''
+
+import argparse
+import glob
+import os
+import sys
+import time
+
+source_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(source_dir, 'xfce4-panel-profiles'))
+
+from panelconfig import PanelConfig  # noqa: E402
+
+
+def parse_all(configs):
+    pc = PanelConfig()
+    for (name, config) in configs:
+        pc.parse_config(config, name)
+    return pc
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the config.txt parser.')
+    parser.add_argument('-n', '--repeat', type=int, default=20,
+                        help='runs, the fastest one is reported')
+    args = parser.parse_args()
+
+    configs = []
+    pattern = os.path.join(source_dir, 'data', 'layouts', '*', 'config.txt')
+    for filename in sorted(glob.glob(pattern)):
+        with open(filename, 'rb') as f:
+            configs.append((os.path.relpath(filename, source_dir), f.read()))
+    values = sum(len([line for line in config.splitlines() if line.strip()])
+                 for (name, config) in configs)
+
+    pc = parse_all(configs)
+    for error in pc.errors:
+        print(error)
+
+    best = None
+    for n in range(args.repeat):
+        start = time.perf_counter()
+        parse_all(configs)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+
+    print(f"{len(configs)} files, {values} values, best of {args.repeat} runs")
+    print(f"parse_config  {best * 1000:8.2f} ms  {best * 1e6 / values:6.2f} us/value")
+    return 1 if pc.errors else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,280 @@
+#!/usr/bin/env python3
+#   Panel Profiles
+#
+#   This program is free software: you can redistribute it and/or modify it
+#   under the terms of the GNU General Public License version 3 or newer,
+#   as published by the Free Software Foundation.
+#
+#   This program is distributed in the hope that it will be useful, but
+#   WITHOUT ANY WARRANTY; without even the implied warranties of
+#   MERCHANTABILITY, SATISFACTORY QUALITY, or FITNESS FOR A PARTICULAR
+#   PURPOSE.  See the GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License along
+#   with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+'''Measure load, save and copy of profiles against a stand-in xfconfd.
+
+A private session bus is started with dbus-daemon, and this script runs a
+second time as a small stand-in for xfconfd (GetAllProperties, SetProperty,
+ResetProperty) and for the panel (Terminate). XDG_CONFIG_HOME points to a
+temporary directory and plugin processes are scanned but never killed, so
+the running desktop is not touched.
+
+Every bundled layout in data/layouts is measured, and so are synthetic
+profiles with thousands of plugins and properties. Loads are measured with
+pipelined xfconf calls and with one call at a time (max pending 1).
+
+usage: benchmarks/profiles.py [-n REPEAT] [--plugins N ...] [--json FILE]
+'''
+
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+source_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(source_dir, 'xfce4-panel-profiles'))
+
+xfconf_xml = '''
+<node>
+  <interface name="org.xfce.Xfconf">
+    <method name="GetAllProperties">
+      <arg type="s" name="channel" direction="in"/>
+      <arg type="s" name="property_base" direction="in"/>
+      <arg type="a{sv}" name="properties" direction="out"/>
+    </method>
+    <method name="SetProperty">
+      <arg type="s" name="channel" direction="in"/>
+      <arg type="s" name="property" direction="in"/>
+      <arg type="v" name="value" direction="in"/>
+    </method>
+    <method name="ResetProperty">
+      <arg type="s" name="channel" direction="in"/>
+      <arg type="s" name="property_base" direction="in"/>
+      <arg type="b" name="recursive" direction="in"/>
+    </method>
+  </interface>
+</node>
+'''
+
+panel_xml = '''
+<node>
+  <interface name="org.xfce.Panel">
+    <method name="Terminate">
+      <arg type="b" name="restart" direction="in"/>
+    </method>
+  </interface>
+</node>
+'''
+
+
+def stand_in():
+    '''Serves xfconfd and panel methods on the session bus until killed.'''
+    from gi.repository import Gio, GLib
+
+    channels = {}
+
+    def in_subtree(pp, base):
+        return base in ('', '/') or pp == base or pp.startswith(base + '/')
+
+    def on_xfconf_call(connection, sender, path, interface, method, parameters, invocation):
+        channel = channels.setdefault(parameters.get_child_value(0).get_string(), {})
+        pp = parameters.get_child_value(1).get_string()
+        if method == 'GetAllProperties':
+            properties = {key: value for (key, value) in channel.items() if in_subtree(key, pp)}
+            invocation.return_value(GLib.Variant('(a{sv})', (properties,)))
+        elif method == 'SetProperty':
+            channel[pp] = parameters.get_child_value(2).get_variant()
+            invocation.return_value(None)
+        elif method == 'ResetProperty':
+            if parameters.get_child_value(2).get_boolean():
+                for key in [key for key in channel if in_subtree(key, pp)]:
+                    del channel[key]
+            else:
+                channel.pop(pp, None)
+            invocation.return_value(None)
+
+    def on_panel_call(connection, sender, path, interface, method, parameters, invocation):
+        invocation.return_value(None)
+
+    connection = Gio.bus_get_sync(Gio.BusType.SESSION, None)
+    for (xml, path, callback) in ((xfconf_xml, '/org/xfce/Xfconf', on_xfconf_call),
+                                  (panel_xml, '/org/xfce/Panel', on_panel_call)):
+        interface = Gio.DBusNodeInfo.new_for_xml(xml).interfaces[0]
+        connection.register_object(path, interface, callback, None, None)
+
+    for name in ('org.xfce.Xfconf', 'org.xfce.Panel'):
+        reply = connection.call_sync(
+            'org.freedesktop.DBus', '/org/freedesktop/DBus', 'org.freedesktop.DBus',
+            'RequestName', GLib.Variant('(su)', (name, 4)), None, 0, -1, None)
+        if reply.unpack()[0] != 1:
+            sys.exit(f"could not own {name}")
+
+    print('ready', flush=True)
+    GLib.MainLoop().run()
+
+
+def synthetic_members(plugins):
+    '''A profile with one panel holding launchers, plugins with an rc file
+    and separators in turn.'''
+    ids = range(1, plugins + 1)
+    lines = [
+        '/configver 2',
+        '/panels [<1>]',
+        "/panels/panel-1/position 'p=6;x=0;y=0'",
+        '/panels/panel-1/size uint32 30',
+        '/panels/panel-1/plugin-ids [' + ', '.join(f'<{n}>' for n in ids) + ']',
+    ]
+    members = {}
+    for n in ids:
+        if n % 3 == 0:
+            lines.append(f"/plugins/plugin-{n} 'launcher'")
+            lines.append(f"/plugins/plugin-{n}/items [<'{n}.desktop'>]")
+            members[f'launcher-{n}/{n}.desktop'] = (
+                f'[Desktop Entry]\nName=Launcher {n}\nExec=true\nType=Application\n').encode('utf8')
+        elif n % 3 == 1:
+            lines.append(f"/plugins/plugin-{n} 'whiskermenu'")
+            members[f'whiskermenu-{n}.rc'] = f'button-title=Menu {n}\nshow-button-icon=true\n'.encode('utf8')
+        else:
+            lines.append(f"/plugins/plugin-{n} 'separator'")
+            lines.append(f'/plugins/plugin-{n}/style uint32 0')
+            lines.append(f'/plugins/plugin-{n}/expand false')
+    members['config.txt'] = '\n'.join(lines).encode('utf8')
+    return members
+
+
+def start_bus(tmp):
+    '''Starts dbus-daemon and the stand-in, returns their processes.'''
+    daemon = subprocess.Popen(['dbus-daemon', '--session', '--nofork', '--print-address=1'],
+                              stdout=subprocess.PIPE, universal_newlines=True)
+    os.environ['DBUS_SESSION_BUS_ADDRESS'] = daemon.stdout.readline().strip()
+    os.environ['XDG_CONFIG_HOME'] = os.path.join(tmp, 'config')
+    os.environ['XDG_DATA_HOME'] = os.path.join(tmp, 'data')
+    server = subprocess.Popen([sys.executable, os.path.abspath(__file__), '--stand-in'],
+                              stdout=subprocess.PIPE, universal_newlines=True)
+    if server.stdout.readline().strip() != 'ready':
+        daemon.terminate()
+        sys.exit('the xfconf stand-in did not start')
+    return (daemon, server)
+
+
+def measure(repeat, func):
+    '''Returns the median time of func and the D-Bus calls it made.'''
+    import paneltrace
+
+    times = []
+    for n in range(repeat):
+        paneltrace.current = paneltrace.Trace()
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    calls = paneltrace.current.get_calls()
+    paneltrace.current = None
+    return (statistics.median(times), calls)
+
+
+def run(args, tmp):
+    # Imported once the environment points to the private bus and the
+    # temporary configuration directory
+    from gi.repository import Gio
+
+    import panelconfig
+    from panelconfig import PanelConfig, copy_profile, get_suffix
+    from compression import pack_layout
+
+    class PluginProcesses(panelconfig.PluginProcesses):
+        # Scan as usual, but leave the plugins of the running desktop alone
+        def kill(self, plugin_id):
+            self.processes.pop(str(plugin_id), None)
+
+    panelconfig.PluginProcesses = PluginProcesses
+
+    xfconf = Gio.DBusProxy.new_sync(
+        Gio.bus_get_sync(Gio.BusType.SESSION, None),
+        Gio.DBusProxyFlags.DO_NOT_LOAD_PROPERTIES, None,
+        'org.xfce.Xfconf', '/org/xfce/Xfconf', 'org.xfce.Xfconf', None)
+
+    profiles = []
+    layouts_dir = os.path.join(source_dir, 'data', 'layouts')
+    for layout in sorted(os.listdir(layouts_dir)):
+        if os.path.isdir(os.path.join(layouts_dir, layout)):
+            filename = os.path.join(tmp, layout + '.tar.bz2')
+            pack_layout(os.path.join(layouts_dir, layout), filename)
+            profiles.append((layout, filename))
+    for plugins in args.plugins:
+        filename = os.path.join(tmp, f'synthetic-{plugins}.tar.bz2')
+        PanelConfig.from_members(synthetic_members(plugins)).to_file(filename)
+        profiles.append((f'synthetic-{plugins}', filename))
+
+    default_pending = panelconfig.xfconf_max_pending
+    results = []
+    print(f"{'profile':<22} {'case':<18} {'props':>6} {'ms':>9} {'props/s':>9} {'call p50':>9} {'call p95':>9}")
+    for (name, filename) in profiles:
+        properties = len(PanelConfig.from_file(filename).properties)
+        output = os.path.join(tmp, 'out.tar.bz2')
+
+        def load(max_pending, incremental=False):
+            def func():
+                panelconfig.xfconf_max_pending = max_pending
+                PanelConfig.from_file(filename).to_xfconf(xfconf, incremental)
+            return func
+
+        cases = [
+            ('load', load(default_pending)),
+            ('load pending=1', load(1)),
+            ('load incremental', load(default_pending, True)),
+            ('save', lambda: PanelConfig.from_xfconf(xfconf).to_file(output)),
+            ('copy', lambda: copy_profile(filename, output)),
+            ('convert gz', lambda: copy_profile(filename, output[:-len('.tar.bz2')] + get_suffix('gz'), 'gz')),
+        ]
+        for (case, func) in cases:
+            (seconds, calls) = measure(args.repeat, func)
+            panelconfig.xfconf_max_pending = default_pending
+            call = calls.get('SetProperty') or calls.get('GetAllProperties')
+            p50 = f"{call['median'] * 1000:9.3f}" if call else f"{'-':>9}"
+            p95 = f"{call['p95'] * 1000:9.3f}" if call else f"{'-':>9}"
+            print(f"{name:<22} {case:<18} {properties:>6} {seconds * 1000:9.2f} "
+                  f"{properties / seconds:9.0f} {p50} {p95}")
+            results.append({'profile': name, 'case': case, 'properties': properties,
+                            'seconds': seconds, 'calls': calls})
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump({'repeat': args.repeat, 'results': results}, f, indent=1)
+            f.write('\n')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark profile load, save and copy.')
+    parser.add_argument('-n', '--repeat', type=int, default=5,
+                        help='runs per measurement, the median is reported')
+    parser.add_argument('--plugins', type=int, nargs='*', default=[100, 1000, 5000],
+                        help='plugin counts of the synthetic profiles')
+    parser.add_argument('--json', metavar='FILE', help='also write the results to FILE')
+    parser.add_argument('--stand-in', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.stand_in:
+        stand_in()
+        return
+
+    tmp = tempfile.mkdtemp(prefix='xfce4-panel-profiles-benchmark-')
+    processes = ()
+    try:
+        processes = start_bus(tmp)
+        run(args, tmp)
+    finally:
+        for process in reversed(processes):
+            process.terminate()
+            process.wait()
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+#   Panel Profiles
+#
+#   This program is free software: you can redistribute it and/or modify it
+#   under the terms of the GNU General Public License version 3 or newer,
+#   as published by the Free Software Foundation.
+#
+#   This program is distributed in the hope that it will be useful, but
+#   WITHOUT ANY WARRANTY; without even the implied warranties of
+#   MERCHANTABILITY, SATISFACTORY QUALITY, or FITNESS FOR A PARTICULAR
+#   PURPOSE.  See the GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License along
+#   with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+'''Measure the startup cost of the command line and of the user interface.
+
+info.py is generated at build time, so this runs against an installed or
+built copy of the program:
+
+usage: benchmarks/startup.py [-n REPEAT] [DIR]
+
+DIR defaults to /usr/share/xfce4-panel-profiles/xfce4-panel-profiles. For
+each case the median wall time and the import time reported by
+'python3 -X importtime' are printed.
+'''
+
+import argparse
+import statistics
+import subprocess
+import sys
+import time
+
+
+def run(command, cwd):
+    start = time.perf_counter()
+    result = subprocess.run(command, cwd=cwd, stdout=subprocess.DEVNULL,
+                            stderr=subprocess.PIPE, universal_newlines=True)
+    elapsed = time.perf_counter() - start
+
+    # import time: self [us] | cumulative | imported package
+    imports = 0
+    for line in result.stderr.splitlines():
+        if line.startswith('import time:'):
+            try:
+                imports += int(line.split(':', 1)[1].split('|')[0])
+            except ValueError:
+                pass
+    return (elapsed, imports / 1000000)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark startup time.')
+    parser.add_argument('directory', nargs='?',
+                        default='/usr/share/xfce4-panel-profiles/xfce4-panel-profiles',
+                        help='directory of the installed xfce4-panel-profiles.py')
+    parser.add_argument('-n', '--repeat', type=int, default=10,
+                        help='runs per case, the median is reported')
+    args = parser.parse_args()
+
+    python = [sys.executable, '-X', 'importtime']
+    cases = [
+        ('command line', python + ['xfce4-panel-profiles.py', '--version']),
+        ('user interface imports', python + ['-c', 'import panelprofiles']),
+    ]
+
+    print(f"{'case':<24} {'wall ms':>9} {'imports ms':>11}")
+    for (label, command) in cases:
+        results = [run(command, args.directory) for n in range(args.repeat)]
+        wall = statistics.median(elapsed for (elapsed, imports) in results)
+        imports = statistics.median(imports for (elapsed, imports) in results)
+        print(f"{label:<24} {wall * 1000:9.1f} {imports * 1000:11.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+#   Panel Profiles
+#
+#   This program is free software: you can redistribute it and/or modify it
+#   under the terms of the GNU General Public License version 3 or newer,
+#   as published by the Free Software Foundation.
+#
+#   This program is distributed in the hope that it will be useful, but
+#   WITHOUT ANY WARRANTY; without even the implied warranties of
+#   MERCHANTABILITY, SATISFACTORY QUALITY, or FITNESS FOR A PARTICULAR
+#   PURPOSE.  See the GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License along
+#   with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+'''Write the index of the bundled layouts.
+
+For every layout tarball, the index holds its name, size and SHA-256, its
+panel and plugin summary, its content hash and its members, with the
+properties already serialized as config.gvariant. It is installed next to the
+tarballs, so listing and applying a bundled layout neither decompresses nor
+parses it.
+
+usage: make-index.py OUTPUT TARBALL...
+'''
+
+import base64
+import hashlib
+import json
+import os
+import sys
+
+source_dir = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+sys.path.insert(0, os.path.join(source_dir, 'xfce4-panel-profiles'))
+
+from panelconfig import PanelConfig, binary_config, to_binary_config  # noqa: E402
+from panelconfig import get_file_hash, get_profile_name, layouts_index_version, read_archive  # noqa: E402
+
+
+def main():
+    if len(sys.argv) < 3:
+        sys.exit(__doc__.split('\n\n')[-1].strip())
+
+    layouts = {}
+    for filename in sys.argv[2:]:
+        # Always from the tarball, never from an index left by an earlier build
+        members = read_archive(filename)
+        pc = PanelConfig.from_members(members)
+        if pc.has_errors():
+            sys.exit(f"{filename}: " + '; '.join(pc.errors))
+        members[binary_config] = to_binary_config(sorted(pc.properties.items()),
+                                                   hashlib.sha256(members['config.txt']).hexdigest())
+
+        layouts[os.path.basename(filename)] = {
+            'name': get_profile_name(os.path.basename(filename)),
+            'size': os.path.getsize(filename),
+            'sha256': get_file_hash(filename),
+            'panels': len(pc.get_panels()),
+            'plugins': pc.get_plugins(),
+            'hash': pc.content_hash(),
+            'members': {name: base64.b64encode(data).decode('ascii')
+                        for (name, data) in sorted(members.items())},
+        }
+
+    with open(sys.argv[1], 'w', encoding='utf-8') as f:
+        json.dump({'version': layouts_index_version, 'layouts': layouts}, f,
+                  sort_keys=True, separators=(',', ':'))
+        f.write('\n')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+#   Panel Profiles
+#
+#   This program is free software: you can redistribute it and/or modify it
+#   under the terms of the GNU General Public License version 3 or newer,
+#   as published by the Free Software Foundation.
+#
+#   This program is distributed in the hope that it will be useful, but
+#   WITHOUT ANY WARRANTY; without even the implied warranties of
+#   MERCHANTABILITY, SATISFACTORY QUALITY, or FITNESS FOR A PARTICULAR
+#   PURPOSE.  See the GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License along
+#   with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Bulk operations on profile archives. Every archive is handled in a worker
+# process and reported as one JSON line, so a broken archive does not stop
+# the rest of the batch.
+
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import json
+import os
+import sys
+import time
+
+from panelconfig import PanelConfig, binary_config, from_binary_config
+from panelconfig import get_profile_name, get_suffix, mkdir_p
+
+
+def find_profiles(paths):
+    for path in paths:
+        if os.path.isdir(path):
+            for filename in sorted(os.listdir(path)):
+                filename = os.path.join(path, filename)
+                if get_profile_name(filename) is not None and os.path.isfile(filename):
+                    yield filename
+        else:
+            yield path
+
+
+def validate(filename):
+    pc = PanelConfig.from_file(filename)
+    for name in pc.desktops:
+        if name not in pc.source:
+            pc.errors.append(name + ': missing from the archive')
+    if binary_config in pc.source:
+        # Older versions only read config.txt, both must hold the same properties
+        text = PanelConfig.from_members({name: data for (name, data) in pc.source.items()
+                                         if name != binary_config})
+        pc.errors.extend(text.errors)
+        if from_binary_config(pc.source[binary_config], pc.source.get('config.txt', b'')) is None:
+            pc.errors.append(binary_config + ': not valid or out of date with config.txt')
+        elif dict(text.properties) != dict(pc.properties):
+            pc.errors.append(binary_config + ': differs from config.txt')
+    return {'ok': not pc.has_errors(), 'errors': pc.errors}
+
+
+def inspect(filename):
+    pc = PanelConfig.from_file(filename)
+    return {
+        'panels': len(pc.get_panels()),
+        'plugins': pc.get_plugins(),
+        'properties': len(pc.properties),
+        'launchers': pc.desktops,
+        'rc_files': pc.rc_files,
+        'hash': pc.content_hash(),
+    }
+
+
+def get_output(filename, compression, output_dir=None):
+    name = get_profile_name(os.path.basename(filename))
+    if name is None:
+        name = os.path.basename(filename)
+    if output_dir is None:
+        output_dir = os.path.dirname(filename)
+    return os.path.join(output_dir, name + get_suffix(compression))
+
+
+def convert(filename, compression, level=None, output_dir=None):
+    output = get_output(filename, compression, output_dir)
+    PanelConfig.from_file(filename).to_file(output, compression, level)
+    return {'output': output, 'size': os.path.getsize(output)}
+
+
+commands = {
+    'validate': validate,
+    'inspect': inspect,
+    'convert': convert,
+}
+
+
+def process(command, filename, *args):
+    result = {'file': filename, 'command': command, 'ok': True}
+    start = time.perf_counter()
+    try:
+        result.update(commands[command](filename, *args))
+    except Exception as e:
+        result['ok'] = False
+        result['error'] = repr(e)
+    result['time'] = round(time.perf_counter() - start, 6)
+    return result
+
+
+def check_outputs(filenames, compression, level=None, output_dir=None):
+    # Returns the files to convert and the results of those that are not.
+    # Files that would be converted to the same output are all reported,
+    # instead of the last one written silently replacing the others.
+    if output_dir is not None:
+        try:
+            mkdir_p(output_dir)
+        except OSError:
+            # Every conversion then reports the error
+            pass
+    outputs = {}
+    for filename in filenames:
+        output = os.path.abspath(get_output(filename, compression, output_dir))
+        outputs.setdefault(output, []).append(filename)
+
+    accepted = []
+    rejected = []
+    for (output, sources) in outputs.items():
+        if len(sources) == 1:
+            accepted.extend(sources)
+            continue
+        for filename in sources:
+            rejected.append({
+                'file': filename, 'command': 'convert', 'ok': False,
+                'error': f"{output} is also the output of " +
+                         ', '.join(other for other in sources if other != filename),
+                'time': 0.0,
+            })
+    return (accepted, rejected)
+
+
+def run(command, paths, *args, jobs=None, out=sys.stdout):
+    failures = 0
+    filenames = list(find_profiles(paths))
+    results = []
+    if command == 'convert':
+        (filenames, results) = check_outputs(filenames, *args)
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        futures = [pool.submit(process, command, filename, *args)
+                   for filename in filenames]
+        for result in results:
+            failures += 1
+            out.write(json.dumps(result) + '\n')
+            out.flush()
+        for future in as_completed(futures):
+            result = future.result()
+            if not result['ok']:
+                failures += 1
+            out.write(json.dumps(result) + '\n')
+            out.flush()
+    return failures
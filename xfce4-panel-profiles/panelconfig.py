@@ -12,16 +12,68 @@
 # * GNU General Public License for more details.
 
 from gi.repository import Gio, GLib
+from concurrent.futures import ThreadPoolExecutor, wait
+from contextlib import contextmanager
+import base64
+import gzip
+import hashlib
+import json
 import tarfile
 import io
 import time
 import os
+import re
+import shutil
+import stat
+import sys
+import tempfile
+import threading
 import psutil
 
+import paneltrace
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
 # yes, python 3.2 has exist_ok, but it will still fail if the mode is different
 
 config_dir = os.path.join(GLib.get_user_config_dir(), 'xfce4/panel/')
 
+# Index of the bundled layouts, generated next to them at build time by
+# data/layouts/make-index.py
+layouts_index_name = 'layouts.index'
+layouts_index_version = 2
+layouts_indexes = {}
+
+# Threads reading and writing launcher and rc files during an apply
+file_workers = 8
+
+# Files replaced by an apply that has not finished yet, see FileTransaction
+journal_file = os.path.join(config_dir, '.xfce4-panel-profiles.journal')
+
+# Number of SetProperty calls sent to xfconfd before waiting for replies
+xfconf_max_pending = 64
+
+# Profile file name suffix and valid compression levels of each compression
+compressions = {
+    'bz2': ('.tar.bz2', range(1, 10)),
+    'gz': ('.tar.gz', range(1, 10)),
+    'xz': ('.tar.xz', range(0, 10)),
+    'zst': ('.tar.zst', range(1, 23)),
+    '': ('.tar', range(0)),
+}
+default_compression = 'bz2'
+
+# Archive member holding the properties as one serialized a{sv}, next to the
+# config.txt that older versions read, with the SHA-256 of that config.txt
+binary_config = 'config.gvariant'
+
+# Size up to which config.txt is formatted in memory when saving, larger
+# ones go to a temporary file
+config_spool_size = 1024 * 1024
+
 def mkdir_p(path):
     try:
         os.makedirs(path, exist_ok=True)
@@ -29,69 +81,761 @@ def mkdir_p(path):
         pass
 
 
+def get_archive_mtime():
+    # Members get the same time in every archive, so saving the same
+    # configuration twice gives the same bytes
+    try:
+        return int(os.environ['SOURCE_DATE_EPOCH'])
+    except (KeyError, ValueError):
+        return 0
+
+
+def get_file_size(f):
+    try:
+        return os.fstat(f.fileno()).st_size
+    except (AttributeError, io.UnsupportedOperation):
+        return f.getbuffer().nbytes
+
+
 def add_to_tar(t, bytes, arcname):
+    add_file_to_tar(t, io.BytesIO(bytes), arcname, len(bytes))
+
+
+def add_file_to_tar(t, f, arcname, size=None):
+    # tarfile copies from f in blocks, nothing is read into memory at once
     ti = tarfile.TarInfo(name=arcname)
-    ti.size = len(bytes)
-    ti.mtime = time.time()
-    f = io.BytesIO(bytes)
+    ti.size = get_file_size(f) if size is None else size
+    ti.mtime = get_archive_mtime()
     t.addfile(ti, fileobj=f)
 
 
+def get_umask():
+    umask = os.umask(0)
+    os.umask(umask)
+    return umask
+
+
+# Setting the umask to read it is not thread safe, read it once
+umask = get_umask()
+
+
+def new_temp_file(path, suffix='.new'):
+    # A hidden file next to path, so that os.replace stays on one file system.
+    # It gets the mode of the file it replaces, or the one open() would give.
+    (fd, tmp) = tempfile.mkstemp(prefix='.' + os.path.basename(path) + '.', suffix=suffix,
+                                 dir=os.path.dirname(path) or '.')
+    try:
+        mode = stat.S_IMODE(os.stat(path).st_mode)
+    except FileNotFoundError:
+        mode = 0o666 & ~umask
+    os.fchmod(fd, mode)
+    return (os.fdopen(fd, 'wb'), tmp)
+
+
+def fsync_path(path, flags=os.O_RDONLY):
+    fd = os.open(path, flags)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def fsync_dir(path):
+    fsync_path(path or '.', os.O_RDONLY | os.O_DIRECTORY)
+
+
+def remove_file(path):
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
+
+
+@contextmanager
+def atomic_write(filename):
+    # A crash leaves either the old contents of filename or the new ones,
+    # never a truncated file.
+    (f, tmp) = new_temp_file(filename)
+    try:
+        with f:
+            yield f
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, filename)
+    except BaseException:
+        remove_file(tmp)
+        raise
+    fsync_dir(os.path.dirname(filename))
+
+
+def has_native_zstd():
+    return 'zst' in tarfile.TarFile.OPEN_METH
+
+
+def get_compressions():
+    return [compression for compression in compressions
+            if compression != 'zst' or has_native_zstd() or zstandard is not None]
+
+
+def get_suffix(compression):
+    return compressions[compression][0]
+
+
+def get_levels(compression):
+    return compressions[compression][1]
+
+
+def get_profile_name(filename):
+    for (suffix, levels) in compressions.values():
+        if filename.endswith(suffix):
+            return filename[:-len(suffix)]
+    return None
+
+
+def get_compression_for_name(filename):
+    for compression in compressions:
+        if compression and filename.endswith('.' + compression):
+            return compression
+    return ''
+
+
+def get_compression(filename):
+    with open(filename, 'rb') as f:
+        header = f.read(512)
+    if header.startswith(b'\x1f\x8b'):
+        return 'gz'
+    elif header.startswith(b'BZh'):
+        return 'bz2'
+    elif header.startswith(b'\xfd7zXZ\x00'):
+        return 'xz'
+    elif header.startswith(b'\x28\xb5\x2f\xfd'):
+        return 'zst'
+    elif header[257:262] == b'ustar':
+        return ''
+    return None
+
+
+@contextmanager
+def open_tar(f, mode, compression, level=None):
+    if compression == 'zst' and not has_native_zstd():
+        if zstandard is None:
+            raise tarfile.CompressionError('zstd module is not available')
+        if mode == 'r':
+            stream = zstandard.ZstdDecompressor().stream_reader(f, closefd=False)
+        else:
+            level = 3 if level is None else level
+            stream = zstandard.ZstdCompressor(level=level).stream_writer(f, closefd=False)
+        with stream, tarfile.open(fileobj=stream, mode=mode + '|') as t:
+            yield t
+        return
+
+    if mode == 'w' and compression == 'gz':
+        # tarfile would store the name of the temporary file and the current
+        # time in the gzip header
+        level = 9 if level is None else level
+        with gzip.GzipFile(filename='', mode='wb', compresslevel=level, fileobj=f,
+                           mtime=get_archive_mtime()) as stream, \
+                tarfile.open(fileobj=stream, mode='w') as t:
+            yield t
+        return
+
+    if mode == 'r':
+        tar_mode = 'r|' + ('*' if compression is None else compression)
+        kwargs = {}
+    else:
+        tar_mode = 'w:' + compression if compression else 'w'
+        kwargs = {}
+        if level is not None and compression:
+            if compression == 'xz':
+                kwargs['preset'] = level
+            elif compression == 'zst':
+                kwargs['level'] = level
+            else:
+                kwargs['compresslevel'] = level
+
+    with tarfile.open(fileobj=f, mode=tar_mode, **kwargs) as t:
+        yield t
+
+
+@contextmanager
+def open_archive(filename, mode='r', compression=None, level=None):
+    # Archives are read as a stream, in a single pass. The compression is
+    # detected from the contents when reading and from the name when writing.
+    if compression is None:
+        if mode == 'r':
+            compression = get_compression(filename)
+        else:
+            compression = get_compression_for_name(filename)
+
+    if mode == 'r':
+        with open(filename, 'rb') as f, open_tar(f, mode, compression) as t:
+            yield t
+    else:
+        # The archive replaces filename only once it is complete, and never
+        # writes through a hard link shared with another profile.
+        with atomic_write(filename) as f, open_tar(f, mode, compression, level) as t:
+            yield t
+
+
+def is_valid_archive(filename):
+    # Check the archive layout without parsing any of the properties
+    has_config = False
+    try:
+        with open_archive(filename) as t:
+            for ti in t:
+                name = os.path.normpath(ti.name)
+                if os.path.isabs(name) or name.startswith('..'):
+                    return False
+                if name == 'config.txt' and ti.isfile():
+                    has_config = True
+    except (tarfile.TarError, EOFError, OSError):
+        return False
+    return has_config
+
+
+def copy_profile(src, dst, compression=None, level=None):
+    # A valid archive that already uses the requested compression is copied
+    # as is instead of being parsed and recompressed.
+    if compression is None:
+        compression = get_compression_for_name(dst)
+    if level is None and get_compression(src) == compression and \
+            is_valid_archive(src):
+        # Staged next to dst and renamed into place like any other write
+        with open(src, 'rb') as f, atomic_write(dst) as out:
+            shutil.copyfileobj(f, out)
+    else:
+        PanelConfig.from_file(src).to_file(dst, compression, level)
+
+
+# Properties the running panel does not pick up: the list of panels, the
+# plugins of each panel and the type of each plugin
+structure_re = re.compile(r'/panels|/panels/panel-[0-9]+/plugin-ids|/plugins/plugin-[0-9]+')
+launcher_items_re = re.compile(r'/plugins/plugin-[0-9]+/items')
+
+
+def classify_property(pp):
+    if structure_re.fullmatch(pp):
+        return 'structure'
+    elif launcher_items_re.fullmatch(pp):
+        return 'launcher'
+    elif pp.startswith('/panels/'):
+        return 'panel'
+    elif pp.startswith('/plugins/'):
+        return 'plugin'
+    return 'structure'
+
+
+# Files a plugin keeps in config_dir: '<type>-<id>.rc' and any other
+# '<type>-<id>.<extension>', or anything in a '<type>-<id>' directory
+plugin_file_re = re.compile(r'([^/.][^/]*?)-([0-9]+)(\.[^/]+|/.+)')
+plugin_dir_re = re.compile(r'([^/.][^/]*?)-([0-9]+)')
+
+
+def is_safe_member(name):
+    parts = name.split('/')
+    return not os.path.isabs(name) and '..' not in parts and '' not in parts
+
+
+def get_plugin_file(name):
+    # (type, id) of the plugin owning a file, or None
+    m = plugin_file_re.fullmatch(name)
+    if m is None or m.group(1) == 'launcher' or not is_safe_member(name):
+        return None
+    return (m.group(1), m.group(2))
+
+
+def is_rc_file(name):
+    # Older profiles may hold rc files under other names
+    return get_plugin_file(name) is not None or \
+        (name.find('.rc') > -1 and is_safe_member(name) and not name.startswith('launcher-'))
+
+
+def scan_plugin_files(directory, names=None):
+    # Indexes the plugin files in directory by plugin id, with a single
+    # directory read and one more for each plugin directory. names, if
+    # known, are the entries of directory.
+    plugin_files = {}
+
+    def add_tree(path, prefix, plugin):
+        try:
+            with os.scandir(path) as it:
+                for dirent in it:
+                    name = prefix + '/' + dirent.name
+                    if dirent.is_dir(follow_symlinks=False):
+                        add_tree(dirent.path, name, plugin)
+                    elif dirent.is_file() and not dirent.name.startswith('.'):
+                        plugin_files.setdefault(plugin[1], []).append((plugin[0], name))
+        except OSError:
+            pass
+
+    if names is None:
+        try:
+            with os.scandir(directory) as it:
+                names = [dirent.name for dirent in it]
+        except OSError:
+            names = []
+
+    for name in names:
+        plugin = get_plugin_file(name)
+        if plugin is not None:
+            plugin_files.setdefault(plugin[1], []).append((plugin[0], name))
+            continue
+        m = plugin_dir_re.fullmatch(name)
+        if m is not None and m.group(1) != 'launcher':
+            add_tree(os.path.join(directory, name), name, (m.group(1), m.group(2)))
+
+    for files in plugin_files.values():
+        files.sort()
+    return plugin_files
+
+
+def is_profile_member(name):
+    return name in ('config.txt', binary_config) or name.startswith('launcher-') or \
+        is_rc_file(name)
+
+
+def to_binary_config(properties, config_hash):
+    # GVariant data is in host byte order, the archive always holds little endian
+    v = GLib.Variant('(sa{sv})', (config_hash, dict(properties)))
+    if sys.byteorder == 'big':
+        v = v.byteswap()
+    return v.get_data_as_bytes().get_data()
+
+
+def from_binary_config(data, config):
+    # Returns the properties stored by to_binary_config, or None if data is
+    # not well formed or was written for another config.txt, as happens when
+    # config.txt is edited by hand
+    v = GLib.Variant.new_from_bytes(GLib.VariantType.new('(sa{sv})'), GLib.Bytes.new(data), False)
+    if not v.is_normal_form():
+        return None
+    if sys.byteorder == 'big':
+        v = v.byteswap()
+    if v.get_child_value(0).get_string() != hashlib.sha256(config).hexdigest():
+        return None
+    v = v.get_child_value(1)
+    properties = []
+    for i in range(v.n_children()):
+        entry = v.get_child_value(i)
+        properties.append((entry.get_child_value(0).get_string(),
+                           entry.get_child_value(1).get_variant()))
+    return properties
+
+
+def get_layouts_index(directory):
+    # The index built with the bundled layouts, or None
+    if directory not in layouts_indexes:
+        try:
+            with open(os.path.join(directory, layouts_index_name), 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            index = data['layouts'] if data.get('version') == layouts_index_version else None
+        except (OSError, ValueError, KeyError, AttributeError):
+            index = None
+        layouts_indexes[directory] = index
+    return layouts_indexes[directory]
+
+
+def get_file_hash(filename):
+    h = hashlib.sha256()
+    with open(filename, 'rb') as f:
+        for block in iter(lambda: f.read(65536), b''):
+            h.update(block)
+    return h.hexdigest()
+
+
+def get_indexed_layout(filename):
+    # The index entry of a bundled layout, if it still describes filename.
+    # Installing does not keep mtimes, so the tarball is compared by its
+    # SHA-256, which costs far less than decompressing and parsing it.
+    index = get_layouts_index(os.path.dirname(os.path.abspath(filename)))
+    if index is None:
+        return None
+    entry = index.get(os.path.basename(filename))
+    try:
+        if entry is None or entry['size'] != os.path.getsize(filename) or \
+                entry['sha256'] != get_file_hash(filename):
+            return None
+    except OSError:
+        return None
+    return entry
+
+
+def read_members(filename):
+    # Bundled layouts come parsed from their index, without decompressing
+    entry = get_indexed_layout(filename)
+    if entry is not None:
+        paneltrace.count('layouts read from the index')
+        return {name: base64.b64decode(data) for (name, data) in entry['members'].items()}
+    return read_archive(filename)
+
+
+def read_archive(filename):
+    # Decompress the archive once, in order, instead of seeking back into it
+    # for every launcher and rc file.
+    members = {}
+    with paneltrace.phase('archive read'), open_archive(filename) as t:
+        for ti in t:
+            if ti.isfile() and is_profile_member(ti.name):
+                members[ti.name] = t.extractfile(ti).read()
+    paneltrace.count('archive bytes read', os.path.getsize(filename))
+    paneltrace.count('member bytes read', sum(len(data) for data in members.values()))
+    return members
+
+
+def get_xfconf_properties(xfconf):
+    start = time.perf_counter()
+    with paneltrace.phase('xfconf read'):
+        result = xfconf.call_sync(
+            'GetAllProperties',
+            GLib.Variant('(ss)', ('xfce4-panel', '')), 0, -1, None)
+    paneltrace.add_call('GetAllProperties', time.perf_counter() - start)
+
+    props = result.get_child_value(0)
+
+    for n in range(props.n_children()):
+        p = props.get_child_value(n)
+        pp = p.get_child_value(0).get_string()
+        pv = p.get_child_value(1).get_variant()
+        yield (pp, pv)
+
+
+def file_differs(path, bytes):
+    try:
+        if os.path.getsize(path) != len(bytes):
+            return True
+        with open(path, 'rb') as f:
+            return f.read() != bytes
+    except OSError:
+        return True
+
+
+class PluginProcesses(object):
+    # External plugins run as 'panel-<id>-<name>' processes. Scanning the
+    # process table once and indexing it by plugin id keeps killing plugins
+    # independent of the number of rc files.
+
+    def __init__(self):
+        self.processes = {}
+        self.killed = []
+        self.scanned = 0
+
+        start = time.monotonic()
+        with paneltrace.phase('process scan'):
+            self.scan()
+        self.scan_time = time.monotonic() - start
+        paneltrace.count('processes scanned', self.scanned)
+
+    def scan(self):
+        for proc in psutil.process_iter(['name']):
+            self.scanned += 1
+            name = proc.info['name']
+            if name is None or not name.startswith('panel-'):
+                continue
+            parts = name.split('-', 2)
+            if len(parts) == 3:
+                self.processes.setdefault(parts[1], []).append(proc)
+
+    def kill(self, plugin_id):
+        for proc in self.processes.pop(str(plugin_id), []):
+            try:
+                proc.kill()
+                self.killed.append((proc.pid, proc.info['name']))
+            except psutil.NoSuchProcess:
+                pass
+
+
+class FileTransaction(object):
+    # Replaces a set of files so that a crash or a full disk leaves either
+    # all of the old files or all of the new ones. New contents are staged
+    # next to their destination, synced in a single pass and renamed into
+    # place. Until the renames are done, the journal lists hard links to the
+    # replaced files, so that recover() can roll back an interrupted apply.
+
+    def __init__(self, journal=None):
+        self.journal = journal_file if journal is None else journal
+        self.staged = []
+        self.directories = set()
+        self.lock = threading.Lock()
+
+    def stage(self, path, bytes):
+        # May be called from several threads
+        directory = os.path.dirname(path)
+        with self.lock:
+            if directory not in self.directories:
+                mkdir_p(directory)
+                self.directories.add(directory)
+        (f, tmp) = new_temp_file(path)
+        with self.lock:
+            self.staged.append((path, tmp))
+        with f:
+            f.write(bytes)
+        paneltrace.count('files written')
+        paneltrace.count('file bytes written', len(bytes))
+
+    def backup(self, path):
+        if not os.path.lexists(path):
+            return None
+        backup = os.path.join(os.path.dirname(path), '.' + os.path.basename(path) + '.orig')
+        remove_file(backup)
+        try:
+            os.link(path, backup)
+        except OSError:
+            # File systems without hard links
+            shutil.copy2(path, backup)
+        return backup
+
+    def commit(self, executor=None):
+        if len(self.staged) == 0:
+            return
+        tmps = [tmp for (path, tmp) in self.staged]
+        if executor is not None:
+            list(executor.map(fsync_path, tmps))
+        else:
+            for tmp in tmps:
+                fsync_path(tmp)
+
+        entries = []
+        try:
+            for (path, tmp) in self.staged:
+                entries.append((path, tmp, self.backup(path)))
+            mkdir_p(os.path.dirname(self.journal))
+            with atomic_write(self.journal) as f:
+                f.write(json.dumps(entries).encode('utf8'))
+
+            for (path, tmp, backup) in entries:
+                os.replace(tmp, path)
+            for d in sorted(set(os.path.dirname(path) for (path, tmp, backup) in entries)):
+                fsync_dir(d)
+        except BaseException:
+            self.rollback(entries)
+            self.abort()
+            raise
+
+        self.staged = []
+        remove_file(self.journal)
+        for (path, tmp, backup) in entries:
+            if backup is not None:
+                remove_file(backup)
+
+    def abort(self):
+        for (path, tmp) in self.staged:
+            remove_file(tmp)
+        self.staged = []
+
+    def rollback(self, entries):
+        # Safe to repeat, and for entries that were never renamed
+        for (path, tmp, backup) in entries:
+            remove_file(tmp)
+            if backup is None:
+                remove_file(path)
+            elif os.path.lexists(backup):
+                os.replace(backup, path)
+        remove_file(self.journal)
+
+    def recover(self):
+        # Roll back the files of an apply that was interrupted
+        try:
+            with open(self.journal, 'rb') as f:
+                entries = json.loads(f.read().decode('utf8'))
+        except FileNotFoundError:
+            return False
+        except ValueError:
+            remove_file(self.journal)
+            return False
+        self.rollback(entries)
+        return True
+
+
+class PanelProperties(dict):
+    # A dict of xfconf properties that also indexes its keys by subtree, e.g.
+    # '/plugins/plugin-3/items' is filed under '/plugins/plugin-3', which in
+    # turn is filed under '/plugins'. Looking up or removing a panel or plugin
+    # then only touches the keys of that panel or plugin.
+
+    def __init__(self, *args, **kwargs):
+        super().__init__()
+        self._keys = {}
+        self._roots = {}
+        self.update(*args, **kwargs)
+
+    def __reduce__(self):
+        return (self.__class__, (dict(self),))
+
+    @staticmethod
+    def _split(key):
+        path = key.split('/', 3)
+        return ('/'.join(path[:2]), '/'.join(path[:3]), len(path) > 2)
+
+    def _add_key(self, key):
+        parent, root, nested = self._split(key)
+        self._keys.setdefault(root, set()).add(key)
+        if nested:
+            self._roots.setdefault(parent, set()).add(root)
+
+    def _remove_key(self, key):
+        parent, root, nested = self._split(key)
+        keys = self._keys[root]
+        keys.discard(key)
+        if len(keys) == 0:
+            del self._keys[root]
+            if nested:
+                roots = self._roots[parent]
+                roots.discard(root)
+                if len(roots) == 0:
+                    del self._roots[parent]
+
+    def __setitem__(self, key, value):
+        if key not in self:
+            self._add_key(key)
+        super().__setitem__(key, value)
+
+    def __delitem__(self, key):
+        super().__delitem__(key)
+        self._remove_key(key)
+
+    def pop(self, key, *default):
+        if key not in self:
+            if default:
+                return default[0]
+            raise KeyError(key)
+        value = self[key]
+        del self[key]
+        return value
+
+    def popitem(self):
+        key, value = super().popitem()
+        self._remove_key(key)
+        return (key, value)
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self[key] = default
+        return self[key]
+
+    def update(self, *args, **kwargs):
+        for key, value in dict(*args, **kwargs).items():
+            self[key] = value
+
+    def clear(self):
+        super().clear()
+        self._keys.clear()
+        self._roots.clear()
+
+    def copy(self):
+        return self.__class__(self)
+
+    def roots(self, parent):
+        # e.g. roots('/plugins') -> ['/plugins/plugin-1', '/plugins/plugin-2']
+        return sorted(self._roots.get(parent, ()))
+
+    def subtree(self, prefix):
+        parent, root, nested = self._split(prefix)
+        if nested:
+            roots = [root]
+        else:
+            roots = [root] + self.roots(parent)
+        return [key for root in roots for key in self._keys.get(root, ())
+                if key == prefix or key.startswith(prefix + '/')]
+
+    def remove_subtree(self, prefix):
+        for key in self.subtree(prefix):
+            del self[key]
+
+
 class PanelConfig(object):
 
     def __init__(self):
         self.desktops = []
-        self.properties = {}
+        self.properties = PanelProperties()
         self.rc_files = []
         self.source = None
         self.errors = []
+        self.plugin_processes = None
+        self.config_files = None
+        self.plugin_files = None
+        self.changes = None
+        self.panel_restarted = False
 
     @classmethod
-    def from_xfconf(cls, xfconf):
-        pc = PanelConfig()
-
-        result = xfconf.call_sync(
-            'GetAllProperties',
-            GLib.Variant('(ss)', ('xfce4-panel', '')), 0, -1, None)
-
-        props = result.get_child_value(0)
+    def from_xfconf(cls, xfconf, verify=False):
+        with paneltrace.phase('from_xfconf'):
+            return cls.from_properties(get_xfconf_properties(xfconf), verify=verify)
 
-        for n in range(props.n_children()):
-            p = props.get_child_value(n)
-            pp = p.get_child_value(0).get_string()
-            pv = p.get_child_value(1).get_variant()
-
-            pn = GLib.Variant.parse(None, str(pv), None, None)
-            assert(pv == pn)
+    @classmethod
+    def from_properties(cls, properties, config_files=None, verify=False):
+        # config_files, if known, is the set of file names in config_dir
+        pc = PanelConfig()
+        pc.config_files = config_files
 
+        for (pp, pv) in properties:
             pc.properties[pp] = pv
 
-        pc.remove_orphans()
-        pc.find_desktops()
-        pc.find_rc_files()
+        if verify:
+            with paneltrace.phase('verify'):
+                pc.verify_properties()
+
+        with paneltrace.phase('find files'):
+            pc.remove_orphans()
+            pc.find_desktops()
+            pc.find_rc_files()
 
         return pc
 
     @classmethod
     def from_file(cls, filename):
-        pc = PanelConfig()
+        with paneltrace.phase('from_file'):
+            return cls.from_members(read_members(filename))
 
-        pc.source = tarfile.open(filename, mode='r')
-        config = pc.source.extractfile('config.txt')
+    @classmethod
+    def from_members(cls, members):
+        pc = PanelConfig()
 
-        for line in config:
-            try:
-                x = line.decode('utf-8').strip().split(' ', 1)
-                pc.properties[x[0]] = GLib.Variant.parse(None, x[1], None, None)
-            except:
-                pass
+        pc.source = members
+        with paneltrace.phase('parse'):
+            properties = None
+            if binary_config in pc.source and 'config.txt' in pc.source:
+                properties = from_binary_config(pc.source[binary_config], pc.source['config.txt'])
+            if properties is not None:
+                pc.properties.update(properties)
+            else:
+                pc.parse_config(pc.source['config.txt'])
 
-        pc.remove_orphans()
-        pc.find_desktops()
-        pc.find_rc_files()
+        with paneltrace.phase('find files'):
+            pc.remove_orphans()
+            pc.find_desktops()
+            pc.find_rc_files()
 
         return pc
 
+    def parse_config(self, config, name='config.txt'):
+        for (number, line) in enumerate(config.splitlines(), 1):
+            try:
+                line = line.decode('utf-8').strip()
+            except UnicodeDecodeError as e:
+                self.errors.append(f'{name}:{number}: {e}')
+                continue
+            if len(line) == 0:
+                continue
+            x = line.split(' ', 1)
+            if len(x) < 2:
+                self.errors.append(f"{name}:{number}: no value for '{x[0]}'")
+                continue
+            try:
+                self.properties[x[0]] = GLib.Variant.parse(None, x[1], None, None)
+            except GLib.Error as e:  # pylint: disable=E0712
+                self.errors.append(f'{name}:{number}: {e.message}')
+
+    def verify_properties(self):
+        # Profiles store properties as text, check they will read back the same
+        for (pp, pv) in sorted(self.properties.items()):
+            try:
+                pn = GLib.Variant.parse(None, str(pv), None, None)
+            except GLib.Error as e:  # pylint: disable=E0712
+                self.errors.append(pp + ': ' + e.message)
+                continue
+            if pv != pn:
+                self.errors.append(pp + ': ' + str(pv) + ' is read back as ' + str(pn))
+
     def source_not_file(self):
         return getattr(self, 'source', None) is None
 
@@ -99,17 +843,14 @@ class PanelConfig(object):
         plugin_ids = set()
         rem_keys = []
 
-        for pp, pv in self.properties.items():
-            path = pp.split('/')
-            if len(path) == 4 and path[0] == '' and path[1] == 'panels' and \
-                    path[2].startswith('panel-') and path[3] == 'plugin-ids':
-                plugin_ids.update(pv)
-
-        for pp, pv in self.properties.items():
-            path = pp.split('/')
-            if len(path) == 3 and path[0] == '' and path[1] == 'plugins' and \
-                    path[2].startswith('plugin-'):
-                number = path[2].split('-')[1]
+        for panel in self.properties.roots('/panels'):
+            pp = panel + '/plugin-ids'
+            if panel.startswith('/panels/panel-') and pp in self.properties:
+                plugin_ids.update(self.properties[pp])
+
+        for plugin in self.properties.roots('/plugins'):
+            if plugin.startswith('/plugins/plugin-') and plugin in self.properties:
+                number = plugin.split('/')[2].split('-')[1]
                 try:
                     if int(number) not in plugin_ids:
                         rem_keys.append('/plugins/plugin-' + number)
@@ -119,11 +860,10 @@ class PanelConfig(object):
         self.remove_keys(rem_keys)
 
     def find_desktops(self):
-        for pp, pv in self.properties.items():
-            path = pp.split('/')
-            if len(path) == 3 and path[0] == '' and path[1] == 'plugins' and \
-                    path[2].startswith('plugin-'):
-                number = path[2].split('-')[1]
+        for plugin in self.properties.roots('/plugins'):
+            pv = self.properties.get(plugin)
+            if plugin.startswith('/plugins/plugin-') and pv is not None:
+                number = plugin.split('/')[2].split('-')[1]
                 if pv.get_type_string() == 's' and \
                         pv.get_string() == 'launcher':
                     prop_path = '/plugins/plugin-' + number + '/items'
@@ -138,9 +878,9 @@ class PanelConfig(object):
             plugin_ids = []
             filenames = []
 
-            for pp in self.properties:
-                path = pp.split('/')
-                if len(path) == 4 and path[0] == '' and path[1] == 'panels' and path[3] == 'plugin-ids':
+            for panel in self.properties.roots('/panels'):
+                pp = panel + '/plugin-ids'
+                if pp in self.properties:
                     plugin_ids.extend(self.properties[pp])
 
             if len(plugin_ids) == 0:
@@ -157,63 +897,96 @@ class PanelConfig(object):
                 if prop == 'launcher':
                     continue
 
-                filename = prop + '-' + plugin_id + '.rc'
-                path = os.path.join(config_dir, filename)
-                if os.path.exists(path):
-                    filenames.append(filename)
+                for (plugin_type, filename) in self.get_plugin_files().get(plugin_id, []):
+                    if plugin_type == prop:
+                        filenames.append(filename)
             self.rc_files = filenames
         else:
-            filenames = self.source.getnames()
-            for filename in filenames:
-                if filename.find('.rc') > -1:
+            for filename in self.source:
+                if is_rc_file(filename):
                     self.rc_files.append(filename)
 
+    def get_plugin_files(self):
+        # Scanned once, and kept for the rest of the save
+        if self.plugin_files is None:
+            with paneltrace.phase('plugin file scan'):
+                self.plugin_files = scan_plugin_files(config_dir, self.config_files)
+        return self.plugin_files
+
     def remove_keys(self, rem_keys):
-        keys = list(self.properties.keys())
-        for param in keys:
-            for bad_plugin in rem_keys:
-                if param == bad_plugin or param.startswith(bad_plugin+'/'):
-                    try:
-                        del self.properties[param]
-                    except KeyError:
-                        pass #  https://bugzilla.xfce.org/show_bug.cgi?id=14934
+        for bad_plugin in rem_keys:
+            self.properties.remove_subtree(bad_plugin)
+
+    def get_panels(self):
+        return [panel for panel in self.properties.roots('/panels')
+                if panel.startswith('/panels/panel-')]
+
+    def get_plugins(self):
+        plugins = []
+        for plugin in self.properties.roots('/plugins'):
+            pv = self.properties.get(plugin)
+            if pv is not None and pv.get_type_string() == 's':
+                plugins.append(pv.get_string())
+        return plugins
+
+    def content_hash(self):
+        # Same properties and files give the same hash, wherever they come from
+        h = hashlib.sha256()
+        for (pp, pv) in sorted(self.properties.items()):
+            h.update(pp.encode('utf8') + b'\0' + pv.get_type_string().encode('utf8') + b'\0')
+            h.update(pv.get_data_as_bytes().get_data())
+            h.update(b'\0')
+        files = [(d, self.get_desktop_source_file) for d in self.desktops] + \
+                [(rc, self.get_rc_source_file) for rc in self.rc_files]
+        for (name, get_source_file) in sorted(files):
+            with get_source_file(name) as f:
+                bytes = f.read()
+            h.update(name.encode('utf8') + b'\0' + str(len(bytes)).encode('ascii') + b'\0')
+            h.update(bytes)
+        return h.hexdigest()
 
     def get_desktop_source_file(self, desktop):
         if self.source_not_file():
             path = os.path.join(config_dir, desktop)
             return open(path, 'rb')
         else:
-            return self.source.extractfile(desktop)
+            return io.BytesIO(self.source[desktop])
 
     def get_rc_source_file(self, rc):
         if self.source_not_file():
             path = os.path.join(config_dir, rc)
             return open(path, 'rb')
         else:
-            return self.source.extractfile(rc)
+            return io.BytesIO(self.source[rc])
 
-    def to_file(self, filename):
-        if filename.endswith('.gz'):
-            mode = 'w:gz'
-        elif filename.endswith('.bz2'):
-            mode = 'w:bz2'
-        else:
-            mode = 'w'
-        t = tarfile.open(name=filename, mode=mode)
-        props_tmp = []
+    def get_config_lines(self):
+        separator = b''
         for (pp, pv) in sorted(self.properties.items()):
-            props_tmp.append(str(pp) + ' ' + str(pv))
-        add_to_tar(t, '\n'.join(props_tmp).encode('utf8'), 'config.txt')
+            yield separator + (str(pp) + ' ' + str(pv)).encode('utf8')
+            separator = b'\n'
 
-        for d in self.desktops:
-            bytes = self.get_desktop_source_file(d).read()
-            add_to_tar(t, bytes, d)
+    def to_file(self, filename, compression=None, level=None):
+        with paneltrace.phase('to_file'), open_archive(filename, 'w', compression, level) as t:
+            # config.txt is formatted once, tarfile needs its size up front
+            config_hash = hashlib.sha256()
+            with tempfile.SpooledTemporaryFile(max_size=config_spool_size) as config:
+                for line in self.get_config_lines():
+                    config.write(line)
+                    config_hash.update(line)
+                size = config.tell()
+                config.seek(0)
+                add_file_to_tar(t, config, 'config.txt', size)
+            add_to_tar(t, to_binary_config(sorted(self.properties.items()), config_hash.hexdigest()),
+                       binary_config)
 
-        for rc in self.rc_files:
-            bytes = self.get_rc_source_file(rc).read()
-            add_to_tar(t, bytes, rc)
+            for d in self.desktops:
+                with self.get_desktop_source_file(d) as f:
+                    add_file_to_tar(t, f, d)
 
-        t.close()
+            for rc in self.rc_files:
+                with self.get_rc_source_file(rc) as f:
+                    add_file_to_tar(t, f, rc)
+        paneltrace.count('archive bytes written', os.path.getsize(filename))
 
     def check_exec(self, program):
         program = program.strip()
@@ -232,7 +1005,72 @@ class PanelConfig(object):
 
         return False
 
-    def to_xfconf(self, xfconf):
+    def call_xfconf(self, xfconf, calls, max_pending=None):
+        # xfconfd handles the messages of a connection in order, so the calls
+        # can be pipelined instead of waiting for each reply in turn.
+        if max_pending is None:
+            max_pending = xfconf_max_pending
+        # The replies are dispatched from a private context, so that waiting
+        # for them does not run GTK events, idle callbacks or file monitors
+        # of the default context in the middle of an apply.
+        context = GLib.MainContext()
+        pending = [0]
+
+        def on_reply(proxy, result, data):
+            (pp, method, start) = data
+            paneltrace.add_call(method, time.perf_counter() - start)
+            pending[0] -= 1
+            try:
+                proxy.call_finish(result)
+            except GLib.Error as e:  # pylint: disable=E0712
+                self.errors.append(pp + ': ' + e.message)
+
+        context.push_thread_default()
+        try:
+            for (pp, method, parameters) in calls:
+                while pending[0] >= max_pending:
+                    context.iteration(True)
+                xfconf.call(method, parameters, 0, -1, None, on_reply, (pp, method, time.perf_counter()))
+                pending[0] += 1
+
+            while pending[0] > 0:
+                context.iteration(True)
+        finally:
+            context.pop_thread_default()
+
+    def set_properties(self, xfconf, properties, max_pending=None):
+        calls = ((pp, 'SetProperty', GLib.Variant('(ssv)', ('xfce4-panel', pp, pv)))
+                 for (pp, pv) in properties)
+        self.call_xfconf(xfconf, calls, max_pending)
+
+    def reset_properties(self, xfconf, properties, max_pending=None):
+        calls = ((pp, 'ResetProperty', GLib.Variant('(ssb)', ('xfce4-panel', pp, False)))
+                 for pp in properties)
+        self.call_xfconf(xfconf, calls, max_pending)
+
+    def diff_properties(self, properties):
+        # Properties to set and keys to reset to turn properties into this config
+        changed = [(pp, pv) for (pp, pv) in sorted(self.properties.items())
+                   if pp not in properties or properties[pp] != pv]
+        removed = [pp for pp in sorted(properties) if pp not in self.properties]
+        return (changed, removed)
+
+    def classify_changes(self, properties, files):
+        # Sorts what an apply changes by how the running panel takes it.
+        # Panel, plugin and launcher changes are picked up live through
+        # xfconf and the launcher file monitors. Structure changes and rc
+        # files need the whole panel restarted.
+        changes = {'structure': [], 'panel': [], 'plugin': [], 'launcher': [], 'rc': []}
+        for pp in properties:
+            changes[classify_property(pp)].append(pp)
+        for name in files:
+            changes['rc' if name in self.rc_files else 'launcher'].append(name)
+        return changes
+
+    def to_xfconf(self, xfconf, incremental=False, hot_reload=False):
+        # With hot_reload, only what changed is applied, and the panel is only
+        # restarted if the changes need it
+        incremental = incremental or hot_reload
         session_bus = Gio.BusType.SESSION
         conn = Gio.bus_get_sync(session_bus, None)
 
@@ -243,44 +1081,109 @@ class PanelConfig(object):
         dbus_proxy = Gio.DBusProxy.new_sync(conn, 0, None, destination, path, interface, None)
 
         if dbus_proxy is not None:
-            # Reset all properties to make sure old settings are invalidated
-            try:
-                xfconf.call_sync('ResetProperty', GLib.Variant(
-                    '(ssb)', ('xfce4-panel', '/', True)), 0, -1, None)
-            except GLib.Error:  # pylint: disable=E0712
-                pass
+            # Put back the files of an apply that did not finish
+            FileTransaction().recover()
 
-            for (pp, pv) in sorted(self.properties.items()):
-                xfconf.call_sync('SetProperty', GLib.Variant(
-                    '(ssv)', ('xfce4-panel', pp, pv)), 0, -1, None)
+            files = FileTransaction()
+            with ThreadPoolExecutor(max_workers=file_workers) as executor:
+                # Read, compare and stage the files while the properties are
+                # written below. Files that already hold the same bytes are
+                # not rewritten.
+                def prepare(name, path, get_source_file):
+                    with paneltrace.phase('file prepare'):
+                        with get_source_file(name) as f:
+                            bytes = f.read()
+                        if not file_differs(path, bytes):
+                            paneltrace.count('files unchanged')
+                            return False
+                        files.stage(path, bytes)
+                        return True
 
-            for d in self.desktops:
-                bytes = self.get_desktop_source_file(d).read()
-                mkdir_p(config_dir + os.path.dirname(d))
-                f = open(config_dir + d, 'wb')
-                f.write(bytes)
-                f.close()
+                desktops = [executor.submit(prepare, d, config_dir + d, self.get_desktop_source_file)
+                            for d in self.desktops]
+                rc_files = [(rc, executor.submit(prepare, rc, os.path.join(config_dir, rc),
+                                                 self.get_rc_source_file))
+                            for rc in self.rc_files]
 
-            for rc in self.rc_files:
-                bytes = self.get_rc_source_file(rc).read()
-                f = open(os.path.join(config_dir, rc), 'wb')
-                f.write(bytes)
-                f.close()
-
-                # Kill the plugin so that it reloads the config we just wrote and does
-                # not overwrite it with its current cache when the panel restarts below.
-                # Some plugins don't save their config when restarting the panel
-                # (e.g. whiskermenu) but others do (e.g. netload)
-                plugin_id = rc.replace('.', '-').split('-')[1]
-                proc_name_prefix = 'panel-' + plugin_id + '-'
-                for proc in psutil.process_iter():
-                    if proc.name().startswith(proc_name_prefix):
-                        proc.kill()
+                changed = []
+                removed = []
+                try:
+                    with paneltrace.phase('xfconf write'):
+                        if incremental:
+                            # Only touch the properties that differ from the live channel
+                            live = dict(get_xfconf_properties(xfconf))
+                            changed, removed = self.diff_properties(live)
+                            self.reset_properties(xfconf, removed)
+                            self.set_properties(xfconf, changed)
+                        else:
+                            # Reset all properties to make sure old settings are invalidated
+                            start = time.perf_counter()
+                            try:
+                                xfconf.call_sync('ResetProperty', GLib.Variant(
+                                    '(ssb)', ('xfce4-panel', '/', True)), 0, -1, None)
+                            except GLib.Error:  # pylint: disable=E0712
+                                pass
+                            paneltrace.add_call('ResetProperty', time.perf_counter() - start)
 
-            try:
-                dbus_proxy.call_sync('Terminate', GLib.Variant('(b)', ('xfce4-panel',)), 0, -1, None)
-            except GLib.GError:  # pylint: disable=E0712
-                pass
+                            self.set_properties(xfconf, sorted(self.properties.items()))
+
+                    with paneltrace.phase('file wait'):
+                        desktops_written = [d for (d, future) in zip(self.desktops, desktops)
+                                            if future.result()]
+                        rc_written = [rc for (rc, future) in rc_files if future.result()]
+                    with paneltrace.phase('file commit'):
+                        files.commit(executor)
+                except BaseException:
+                    for (rc, future) in rc_files:
+                        future.cancel()
+                    for future in desktops:
+                        future.cancel()
+                    wait(desktops + [future for (rc, future) in rc_files])
+                    files.abort()
+                    raise
+
+            restart_panel = True
+            if hot_reload:
+                self.changes = self.classify_changes(
+                    [pp for (pp, pv) in changed] + removed, desktops_written + rc_written)
+                # A killed external plugin is not reliably restarted quietly:
+                # the panel may ask whether to restart it instead, so changed
+                # rc files still go through a full panel restart
+                restart_panel = len(self.changes['structure']) > 0 or \
+                    len(self.changes['rc']) > 0
+
+            # A full apply restarts every plugin with an rc file, an incremental
+            # one only those whose rc file changed
+            plugin_ids = []
+            for rc in (rc_written if incremental else self.rc_files):
+                plugin = get_plugin_file(rc)
+                if plugin is not None and plugin[1] not in plugin_ids:
+                    plugin_ids.append(plugin[1])
+
+            # The process table is scanned only now: the panel starts plugins
+            # in response to the property writes above, and a plugin missing
+            # from the scan would live on and could overwrite its new rc file
+            self.plugin_processes = None
+            with paneltrace.phase('plugin kill'):
+                for plugin_id in plugin_ids:
+                    # Kill the plugin so that it reloads the config we just wrote and does
+                    # not overwrite it with its current cache when the panel restarts below.
+                    # Some plugins don't save their config when restarting the panel
+                    # (e.g. whiskermenu) but others do (e.g. netload)
+                    if self.plugin_processes is None:
+                        self.plugin_processes = PluginProcesses()
+                    self.plugin_processes.kill(plugin_id)
+            if self.plugin_processes is not None:
+                paneltrace.count('plugins killed', len(self.plugin_processes.killed))
+
+            self.panel_restarted = restart_panel
+            if restart_panel:
+                start = time.perf_counter()
+                try:
+                    dbus_proxy.call_sync('Terminate', GLib.Variant('(b)', ('xfce4-panel',)), 0, -1, None)
+                except GLib.GError:  # pylint: disable=E0712
+                    pass
+                paneltrace.add_call('Terminate', time.perf_counter() - start)
 
     def has_errors(self):
         return len(self.errors) > 0
@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+#   Panel Profiles
+#
+#   This program is free software: you can redistribute it and/or modify it
+#   under the terms of the GNU General Public License version 3 or newer,
+#   as published by the Free Software Foundation.
+#
+#   This program is distributed in the hope that it will be useful, but
+#   WITHOUT ANY WARRANTY; without even the implied warranties of
+#   MERCHANTABILITY, SATISFACTORY QUALITY, or FITNESS FOR A PARTICULAR
+#   PURPOSE.  See the GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License along
+#   with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import base64
+import json
+import os
+import time
+import zlib
+
+from gi.repository import GLib
+
+from panelconfig import PanelConfig, mkdir_p
+
+history_file = os.path.join(GLib.get_user_data_dir(), 'xfce4-panel-profiles', 'history.log')
+
+
+class PanelHistory(object):
+
+    '''Append-only log of snapshots of the panel configuration.
+
+    Each line of the log is a JSON record holding the properties (as text)
+    and files that changed since the previous snapshot. Every
+    checkpoint_interval snapshots a record holds the full state instead, so
+    restoring a snapshot replays at most that many records.'''
+
+    checkpoint_interval = 50
+
+    def __init__(self, filename=history_file):
+        self.filename = filename
+
+    def read_records(self):
+        try:
+            with open(self.filename, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        yield json.loads(line)
+                    except ValueError:
+                        # A write that was interrupted by a crash
+                        continue
+        except FileNotFoundError:
+            return
+
+    def snapshots(self):
+        '''Returns (id, time, checkpoint, changes) for every snapshot.'''
+        return [(record['id'], record['time'], record['checkpoint'],
+                 len(record['set']) + len(record['reset']) +
+                 len(record['files']) + len(record['removed_files']))
+                for record in self.read_records()]
+
+    def read_records_backwards(self, block_size=65536):
+        '''Yields the records from the last one to the first, reading the
+        log from its end in blocks.'''
+        try:
+            f = open(self.filename, 'rb')
+        except FileNotFoundError:
+            return
+        with f:
+            end = f.seek(0, os.SEEK_END)
+            rest = b''
+            while end > 0:
+                start = max(0, end - block_size)
+                f.seek(start)
+                lines = (f.read(end - start) + rest).split(b'\n')
+                # The first line may continue in the previous block
+                rest = lines.pop(0) if start > 0 else b''
+                for line in reversed(lines):
+                    try:
+                        yield json.loads(line)
+                    except ValueError:
+                        # An empty line, or a write interrupted by a crash
+                        continue
+                end = start
+
+    def get_state(self, snapshot_id=None):
+        '''Returns (properties, files, last id, records since checkpoint) at
+        snapshot_id, or at the last snapshot if snapshot_id is None.
+
+        Only the records from the last checkpoint at or before the snapshot
+        are decoded.'''
+        records = []
+        for record in self.read_records_backwards():
+            if snapshot_id is not None and record['id'] > snapshot_id:
+                continue
+            records.append(record)
+            if record['checkpoint']:
+                break
+        records.reverse()
+
+        properties = {}
+        files = {}
+        last_id = None
+        for record in records:
+            properties.update(record['set'])
+            for pp in record['reset']:
+                properties.pop(pp, None)
+            for (name, data) in record['files'].items():
+                files[name] = zlib.decompress(base64.b64decode(data))
+            for name in record['removed_files']:
+                files.pop(name, None)
+            last_id = record['id']
+        if snapshot_id is not None and last_id != snapshot_id:
+            raise KeyError(snapshot_id)
+        return (properties, files, last_id, len(records))
+
+    def record(self, pc):
+        '''Appends a snapshot of pc, returns its id or None if nothing changed.'''
+        properties = {pp: str(pv) for (pp, pv) in pc.properties.items()}
+        files = {}
+        for d in pc.desktops:
+            with pc.get_desktop_source_file(d) as f:
+                files[d] = f.read()
+        for rc in pc.rc_files:
+            with pc.get_rc_source_file(rc) as f:
+                files[rc] = f.read()
+
+        (old_properties, old_files, last_id, since_checkpoint) = self.get_state()
+        if last_id is not None and old_properties == properties and old_files == files:
+            return None
+
+        checkpoint = last_id is None or since_checkpoint >= self.checkpoint_interval
+        if checkpoint:
+            old_properties = {}
+            old_files = {}
+
+        record = {
+            'id': 0 if last_id is None else last_id + 1,
+            'time': int(time.time()),
+            'checkpoint': checkpoint,
+            'set': {pp: pv for (pp, pv) in sorted(properties.items())
+                    if old_properties.get(pp) != pv},
+            'reset': sorted(pp for pp in old_properties if pp not in properties),
+            'files': {name: base64.b64encode(zlib.compress(data)).decode('ascii')
+                      for (name, data) in sorted(files.items())
+                      if old_files.get(name) != data},
+            'removed_files': sorted(name for name in old_files if name not in files),
+        }
+
+        mkdir_p(os.path.dirname(self.filename))
+        with open(self.filename, 'a+b') as f:
+            # Terminate a line left incomplete by a crash, so that the record
+            # does not end up on the same line
+            if f.seek(0, os.SEEK_END) > 0:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b'\n':
+                    f.write(b'\n')
+            f.write(json.dumps(record, separators=(',', ':')).encode('utf-8') + b'\n')
+            f.flush()
+            os.fsync(f.fileno())
+        return record['id']
+
+    def restore(self, snapshot_id):
+        '''Returns the PanelConfig of a snapshot.'''
+        (properties, files, last_id, since_checkpoint) = self.get_state(snapshot_id)
+        config = '\n'.join(pp + ' ' + pv for (pp, pv) in sorted(properties.items()))
+        members = dict(files)
+        members['config.txt'] = config.encode('utf8')
+        return PanelConfig.from_members(members)
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+#   Panel Profiles
+#
+#   This program is free software: you can redistribute it and/or modify it
+#   under the terms of the GNU General Public License version 3 or newer,
+#   as published by the Free Software Foundation.
+#
+#   This program is distributed in the hope that it will be useful, but
+#   WITHOUT ANY WARRANTY; without even the implied warranties of
+#   MERCHANTABILITY, SATISFACTORY QUALITY, or FITNESS FOR A PARTICULAR
+#   PURPOSE.  See the GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License along
+#   with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+
+from gi.repository import Gio
+
+from panelconfig import PanelConfig, config_dir, get_xfconf_properties
+
+
+class LivePanelConfig(object):
+
+    '''Mirror of the live panel configuration for long running processes.
+
+    The xfce4-panel channel is fetched once, on first use, and then kept up to
+    date from the PropertyChanged and PropertyRemoved signals of xfconfd. The
+    names of the files in the panel configuration directory are tracked with
+    a file monitor, so taking a PanelConfig of the live state needs neither a
+    D-Bus round trip nor a stat per plugin.'''
+
+    def __init__(self, xfconf):
+        self.xfconf = xfconf
+        self.properties = None
+        self.files = None
+
+        xfconf.connect('g-signal', self.on_xfconf_signal)
+        xfconf.connect('notify::g-name-owner', self.on_xfconf_owner_changed)
+
+        self.monitor = Gio.File.new_for_path(config_dir).monitor_directory(
+            Gio.FileMonitorFlags.WATCH_MOVES, None)
+        self.monitor.connect('changed', self.on_config_dir_changed)
+
+    def load(self):
+        self.properties = dict(get_xfconf_properties(self.xfconf))
+        try:
+            self.files = set(os.listdir(config_dir))
+        except OSError:
+            self.files = set()
+
+    def get_config(self):
+        '''Returns a PanelConfig of the live configuration.'''
+        if self.properties is None:
+            self.load()
+        return PanelConfig.from_properties(list(self.properties.items()),
+                                           set(self.files))
+
+    def on_xfconf_signal(self, proxy, sender_name, signal_name, parameters):
+        if self.properties is None:
+            return
+        if parameters.get_child_value(0).get_string() != 'xfce4-panel':
+            return
+        pp = parameters.get_child_value(1).get_string()
+        if signal_name == 'PropertyChanged':
+            self.properties[pp] = parameters.get_child_value(2).get_variant()
+        elif signal_name == 'PropertyRemoved':
+            self.properties.pop(pp, None)
+
+    def on_xfconf_owner_changed(self, proxy, pspec):
+        # xfconfd restarted, changes may have been missed
+        self.properties = None
+
+    def on_config_dir_changed(self, monitor, file, other_file, event_type):
+        if self.files is None:
+            return
+        if event_type in (Gio.FileMonitorEvent.CREATED,
+                          Gio.FileMonitorEvent.MOVED_IN):
+            self.files.add(file.get_basename())
+        elif event_type in (Gio.FileMonitorEvent.DELETED,
+                            Gio.FileMonitorEvent.MOVED_OUT):
+            self.files.discard(file.get_basename())
+        elif event_type == Gio.FileMonitorEvent.RENAMED:
+            self.files.discard(file.get_basename())
+            self.files.add(other_file.get_basename())
@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+#   Panel Profiles
+#
+#   This program is free software: you can redistribute it and/or modify it
+#   under the terms of the GNU General Public License version 3 or newer,
+#   as published by the Free Software Foundation.
+#
+#   This program is distributed in the hope that it will be useful, but
+#   WITHOUT ANY WARRANTY; without even the implied warranties of
+#   MERCHANTABILITY, SATISFACTORY QUALITY, or FITNESS FOR A PARTICULAR
+#   PURPOSE.  See the GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License along
+#   with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+# Where the time of a save or an apply goes. Tracing is off unless the
+# XFCE4_PANEL_PROFILES_PROFILE environment variable is set, to 1 or to the
+# name of a JSON trace file, or the command line is given --profile. When it
+# is off, the functions below do nothing.
+
+import atexit
+from contextlib import contextmanager
+import json
+import os
+import sys
+import threading
+import time
+
+# Upper bounds, in seconds, of the D-Bus latency histogram buckets
+latency_buckets = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1)
+
+environment_variable = 'XFCE4_PANEL_PROFILES_PROFILE'
+
+
+class Trace(object):
+
+    '''Phases, D-Bus calls and counters recorded while tracing.
+
+    Phases may nest and may be entered from several threads, so their times
+    can add up to more than the wall time.'''
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.start = time.perf_counter()
+        self.metadata = {'pid': os.getpid(), 'time': time.time()}
+        self.phases = {}
+        self.events = []
+        self.calls = {}
+        self.counters = {}
+
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            end = time.perf_counter()
+            with self.lock:
+                (count, total) = self.phases.get(name, (0, 0.0))
+                self.phases[name] = (count + 1, total + end - start)
+                self.events.append({
+                    'phase': name,
+                    'thread': threading.current_thread().name,
+                    'start': start - self.start,
+                    'duration': end - start,
+                })
+
+    def add_call(self, method, seconds):
+        with self.lock:
+            self.calls.setdefault(method, []).append(seconds)
+
+    def count(self, name, n=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+
+    def get_calls(self):
+        calls = {}
+        for (method, latencies) in sorted(self.calls.items()):
+            latencies = sorted(latencies)
+            histogram = [0] * (len(latency_buckets) + 1)
+            for seconds in latencies:
+                bucket = 0
+                while bucket < len(latency_buckets) and seconds > latency_buckets[bucket]:
+                    bucket += 1
+                histogram[bucket] += 1
+            calls[method] = {
+                'count': len(latencies),
+                'total': sum(latencies),
+                'median': latencies[len(latencies) // 2],
+                'p95': latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))],
+                'max': latencies[-1],
+                'buckets': list(latency_buckets) + [None],
+                'histogram': histogram,
+            }
+        return calls
+
+    def to_dict(self):
+        with self.lock:
+            return {
+                'metadata': self.metadata,
+                'wall': time.perf_counter() - self.start,
+                'phases': {name: {'count': count, 'total': total}
+                           for (name, (count, total)) in sorted(self.phases.items())},
+                'calls': self.get_calls(),
+                'counters': dict(sorted(self.counters.items())),
+                'events': list(self.events),
+            }
+
+    def summary(self):
+        data = self.to_dict()
+        lines = [f"wall time {data['wall'] * 1000:.1f} ms"]
+        for (name, phase) in data['phases'].items():
+            lines.append(f"  {name:<24} {phase['total'] * 1000:9.1f} ms  {phase['count']:>6}x")
+        for (method, call) in data['calls'].items():
+            lines.append(f"  D-Bus {method:<18} {call['count']:>6} calls, median "
+                         f"{call['median'] * 1000:.2f} ms, p95 {call['p95'] * 1000:.2f} ms, "
+                         f"max {call['max'] * 1000:.2f} ms")
+        for (name, value) in data['counters'].items():
+            lines.append(f"  {name:<24} {value:>9}")
+        return '\n'.join(lines)
+
+
+current = None
+output = None
+
+
+def enable(filename=None, **metadata):
+    '''Starts tracing. At exit, a summary is printed on stderr and, if
+    filename is given, the JSON trace is written to it.'''
+    global current, output
+    if current is None:
+        current = Trace()
+        atexit.register(report)
+    if filename:
+        output = filename
+    current.metadata.update(metadata)
+    return current
+
+
+def report():
+    if current is None:
+        return
+    print(current.summary(), file=sys.stderr)
+    if output:
+        with open(output, 'w', encoding='utf-8') as f:
+            json.dump(current.to_dict(), f, indent=1)
+            f.write('\n')
+
+
+@contextmanager
+def phase(name):
+    if current is None:
+        yield
+    else:
+        with current.phase(name):
+            yield
+
+
+def add_call(method, seconds):
+    if current is not None:
+        current.add_call(method, seconds)
+
+
+def count(name, n=1):
+    if current is not None:
+        current.count(name, n)
+
+
+if os.environ.get(environment_variable):
+    enable(None if os.environ[environment_variable] == '1' else os.environ[environment_variable])
@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+#   Panel Profiles
+#   Copyright (C) 2015-2021 Sean Davis <bluesabre@xfce.org>
+#
+#   This program is free software: you can redistribute it and/or modify it
+#   under the terms of the GNU General Public License version 3 or newer,
+#   as published by the Free Software Foundation.
+#
+#   This program is distributed in the hope that it will be useful, but
+#   WITHOUT ANY WARRANTY; without even the implied warranties of
+#   MERCHANTABILITY, SATISFACTORY QUALITY, or FITNESS FOR A PARTICULAR
+#   PURPOSE.  See the GNU General Public License for more details.
+#
+#   You should have received a copy of the GNU General Public License along
+#   with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+import json
+import os
+import tarfile
+import threading
+import time
+
+from panelconfig import PanelConfig, get_indexed_layout, get_profile_name, mkdir_p
+
+
+class ProfileIndex(object):
+
+    '''On-disk cache of the saved profiles and their contents.
+
+    Entries are keyed by path and are only trusted while the size and mtime
+    of the profile are unchanged. Listing profiles only needs a stat of
+    each directory that did not change since the last scan. The panel and
+    plugin summary and the content hash are recorded when a profile is
+    saved, and read from other profiles the first time they are needed.
+    The index may be shared between threads.'''
+
+    version = 2
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.entries = {}
+        self.directories = {}
+        self.dirty = False
+        self.lock = threading.RLock()
+        self.load()
+
+    def load(self):
+        try:
+            with open(self.filename, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get('version') == self.version:
+                self.entries = data['profiles']
+                self.directories = data['directories']
+        except (OSError, ValueError, KeyError, AttributeError):
+            self.entries = {}
+            self.directories = {}
+
+    def save(self):
+        with self.lock:
+            if not self.dirty:
+                return
+            data = {'version': self.version, 'profiles': self.entries,
+                    'directories': self.directories}
+            tmp = self.filename + '.tmp'
+            try:
+                mkdir_p(os.path.dirname(self.filename))
+                with open(tmp, 'w', encoding='utf-8') as f:
+                    json.dump(data, f)
+                os.replace(tmp, self.filename)
+                self.dirty = False
+            except OSError:
+                pass
+
+    def get(self, path, stat=None):
+        '''Returns the entry of path, updating it if the file changed.'''
+        with self.lock:
+            if stat is None:
+                stat = os.stat(path)
+            entry = self.entries.get(path)
+            if entry is None or entry['mtime'] != stat.st_mtime_ns or \
+                    entry['size'] != stat.st_size:
+                entry = {
+                    'name': get_profile_name(os.path.basename(path)),
+                    'mtime': stat.st_mtime_ns,
+                    'size': stat.st_size,
+                }
+                self.entries[path] = entry
+                self.dirty = True
+            return entry
+
+    def get_details(self, path):
+        '''Returns the entry of path with its panel and plugin summary and
+        its content hash, reading the profile if they are not known yet.
+        The profile is read without holding the lock.'''
+        with self.lock:
+            entry = self.get(path)
+            if 'hash' in entry:
+                return entry
+            (mtime, size) = (entry['mtime'], entry['size'])
+
+        layout = get_indexed_layout(path)
+        if layout is not None:
+            # A bundled layout, summarized at build time
+            details = {'panels': layout['panels'], 'plugins': layout['plugins'],
+                       'hash': layout['hash']}
+        else:
+            try:
+                pc = PanelConfig.from_file(path)
+                details = {'panels': len(pc.get_panels()), 'plugins': pc.get_plugins(),
+                           'hash': pc.content_hash()}
+            except (tarfile.TarError, EOFError, KeyError, OSError):
+                details = {'panels': 0, 'plugins': [], 'hash': None}
+
+        with self.lock:
+            entry = self.get(path)
+            # Unless the profile changed while it was read
+            if entry['mtime'] == mtime and entry['size'] == size and 'hash' not in entry:
+                entry.update(details)
+                self.dirty = True
+            return entry
+
+    def scan(self, directories):
+        '''Returns (path, entry) for every profile in directories and drops
+        the entries of profiles that no longer exist.
+
+        A directory whose mtime is unchanged since the last scan had no
+        profile added, removed or renamed, its cached entries are returned
+        without listing it. Profiles are saved by renaming a temporary file
+        into place, which updates the mtime of their directory. Directories
+        are listed without holding the lock.'''
+        results = []
+        for directory in directories:
+            try:
+                mtime = os.stat(directory).st_mtime_ns
+            except OSError:
+                mtime = None
+            with self.lock:
+                if mtime is not None and self.directories.get(directory) == mtime:
+                    results.extend((path, entry) for (path, entry) in self.entries.items()
+                                   if os.path.dirname(path) == directory)
+                    continue
+
+            found = []
+            try:
+                with os.scandir(directory) as it:
+                    for dirent in it:
+                        if get_profile_name(dirent.name) is None or \
+                                not dirent.is_file():
+                            continue
+                        found.append((dirent.path, dirent.stat()))
+            except OSError:
+                pass
+
+            with self.lock:
+                paths = set(path for (path, stat) in found)
+                for path in list(self.entries):
+                    if os.path.dirname(path) == directory and path not in paths:
+                        del self.entries[path]
+                results.extend((path, self.get(path, stat)) for (path, stat) in found)
+
+                # A profile added within the timestamp granularity of the
+                # directory would not change its mtime, so a directory that
+                # was just modified is listed again on the next scan
+                if mtime is not None and time.time_ns() - mtime > 2000000000:
+                    self.directories[directory] = mtime
+                else:
+                    self.directories.pop(directory, None)
+                self.dirty = True
+
+        return results
+
+    def search(self, directories, text):
+        '''Returns the paths of the profiles whose name or plugins match text.'''
+        text = text.lower()
+        matches = []
+        for (path, entry) in self.scan(directories):
+            entry = self.get_details(path)
+            if text in entry['name'].lower() or \
+                    any(text in plugin.lower() for plugin in entry['plugins']):
+                matches.append(path)
+        return matches
+
+    def find_duplicates(self, directories):
+        '''Returns lists of paths of profiles that have the same contents.'''
+        by_hash = {}
+        for (path, entry) in self.scan(directories):
+            entry = self.get_details(path)
+            if entry['hash'] is not None:
+                by_hash.setdefault(entry['hash'], []).append(path)
+        return [sorted(paths) for paths in by_hash.values() if len(paths) > 1]
+
+    def update(self, path, pc, content_hash=None):
+        '''Records the details of a profile that was just written from pc.
+
+        The time of the save is kept as well: a profile saved as a hard link
+        to an identical one shares its mtime.'''
+        with self.lock:
+            entry = self.get(path)
+            entry['panels'] = len(pc.get_panels())
+            entry['plugins'] = pc.get_plugins()
+            entry['hash'] = pc.content_hash() if content_hash is None else content_hash
+            entry['created'] = int(time.time())
+            self.dirty = True
+            self.save()
+
+    def get_created(self, entry):
+        '''Returns the time in seconds a profile was saved at.'''
+        return entry.get('created', entry['mtime'] // 1000000000)
+
+    def find_by_hash(self, directories, content_hash):
+        '''Returns the paths of the profiles whose contents hash to
+        content_hash. Only the hashes already in the index are compared, no
+        profile is read, so profiles that were never hashed are not found.'''
+        with self.lock:
+            candidates = [(path, entry) for (path, entry) in self.entries.items()
+                          if entry.get('hash') == content_hash and
+                          os.path.dirname(path) in directories]
+        paths = []
+        for (path, entry) in candidates:
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            if entry['mtime'] == stat.st_mtime_ns and entry['size'] == stat.st_size:
+                paths.append(path)
+        return paths